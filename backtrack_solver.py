@@ -3,67 +3,844 @@ Backtrack Solver for CSPs. Copyright Prof. Dr. Karl Stroetmann.
 '''
 
 import ast
-from typing import TypeVar
+import builtins
+import multiprocessing
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from itertools import islice, product
+from multiprocessing.synchronize import Event
+from typing import Any, Callable, Iterator, TypeVar
 
 Value = TypeVar('Value')
 Element = TypeVar('Element')
 Variable = str
 Formula = str
-CSP = tuple[set[Variable] | list[Variable], set[Value], set[Formula]]
-ACSP = tuple[set[Variable] | list[Variable], set[Value], list[tuple[Formula, set[Variable]]]]
+Predicate = Callable[..., bool]
+
+
+@dataclass(frozen=True)
+class AllDifferent:
+    '''Global constraint stating that all variables must take pairwise different values.'''
+
+    variables: frozenset[Variable]
+
+    def __str__(self) -> str:
+        return f'all_different({", ".join(sorted(self.variables))})'
+
+
+@dataclass
+class SearchStats:  # pylint: disable=R0902
+    '''Statistics collected by the solver if an instance is passed as stats.'''
+
+    nodes: int = 0           # successful assignments
+    max_depth: int = 0
+    evaluations: Counter[str] = field(default_factory=Counter)    # per constraint
+    failures: Counter[Variable] = field(default_factory=Counter)  # rejected values per variable
+    prunes: int = 0          # values removed from domains by propagation during the search
+    backjumps: int = 0       # jumps that skipped at least one level
+    nogoods_learned: int = 0
+    nogood_hits: int = 0     # assignments rejected by a learned nogood
+    times: dict[str, float] = field(default_factory=dict)  # seconds spent in parse, index, propagation, search
+
+    def merge(self, other: 'SearchStats') -> None:
+        '''Adds the statistics of another search, e.g. of a worker process.'''
+
+        self.nodes += other.nodes
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.evaluations.update(other.evaluations)
+        self.failures.update(other.failures)
+        self.prunes += other.prunes
+        self.backjumps += other.backjumps
+        self.nogoods_learned += other.nogoods_learned
+        self.nogood_hits += other.nogood_hits
+        for phase, seconds in other.times.items():
+            self.times[phase] = self.times.get(phase, 0.0) + seconds
+
+
+CSP = tuple[set[Variable] | list[Variable], set[Value], set[Formula | AllDifferent]]
+Check = tuple[Formula, tuple[Variable, ...], Predicate]
+Constraint = Check | AllDifferent
 Assignment = dict[Variable, Value]
+Domains = dict[Variable, set[Value]]
+Trail = list[tuple[Variable, set[Value]]]
+Index = dict[Variable, list[Constraint]]
+Nogood = frozenset[tuple[Variable, Value]]
+Hook = Callable[[str, Variable, Value], None]
+VariableOrder = Callable[[list[Variable], Domains, Index], Variable]
+ValueOrder = Callable[[Variable, list[Value], Assignment, Domains, Index], list[Value]]
+
+
+def solve(p: CSP, workers: int = 1, portfolio: bool = False, **options: Any) -> Assignment | None:
+    '''Solves a CSP using backtracking. The keyword arguments are those of solve_all.
+
+    With workers > 1 the search space is split into disjoint subproblems by fixing the most constrained variables,
+    which are solved by a pool of worker processes. With portfolio=True the workers instead race different variable
+    and value orderings on the whole CSP. Either way, the first solution found cancels the remaining work.
+    '''
+
+    if workers <= 1:
+        return next(solve_all(p, **options), None)
+    return _solve_parallel(p, workers, portfolio, options)
+
+
+def solve_all(p: CSP,
+              propagation: str | None = None,
+              var_order: VariableOrder | None = None,
+              value_order: ValueOrder | None = None,
+              backjump: bool = False,
+              nogood_limit: int = 10_000,
+              stats: SearchStats | None = None,
+              hook: Hook | None = None) -> Iterator[Assignment]:
+    '''Lazily enumerates all solutions of a CSP using backtracking.
+
+    With propagation='forward' every variable keeps a live domain that is pruned by forward checking after each
+    assignment. With propagation='ac3' the binary constraints are additionally kept arc consistent using AC-3.
+    In both modes the search backtracks as soon as a domain becomes empty.
+
+    var_order chooses the next variable and value_order sorts the values tried for it, e.g.
+    minimum_remaining_values and least_constraining_value. By default the variables are assigned in the order of
+    the CSP (sorted if they are given as a set) and the values are tried in ascending order.
 
+    With backjump=True the search uses conflict-directed backjumping: at a dead end it jumps back to the most recent
+    variable involved in the conflict. The conflicting partial assignments are learned as nogoods, of which the
+    nogood_limit most recently used ones are kept.
 
-def solve(p: CSP) -> Assignment | None:
-    '''Solves a CSP using backtracking.'''
+    If stats is given, the solver fills it with the statistics described in SearchStats. hook is called as
+    hook(event, var, value) whenever a value is assigned (event 'assign') or taken back (event 'backtrack').
+    Neither costs more than a check for None when omitted.
+    '''
 
-    variables, values, constraints = p
-    csp = (variables, values, [(f, _collect_variables(f)) for f in constraints])
-    return _backtrack_search({}, csp)
+    return _solver(p, propagation, var_order, value_order, backjump, nogood_limit, stats, hook).solve()
 
 
-def all_different(v: set[str]) -> set[str]:
+def count_solutions(p: CSP, limit: int | None = None, **options: Any) -> int:
+    '''Counts the solutions of a CSP, stopping early once limit solutions have been found.
+
+    count_solutions(p, limit=2) == 1 checks that p has a unique solution. The keyword arguments are those of
+    solve_all.
+    '''
+
+    return sum(1 for _ in islice(solve_all(p, **options), limit))
+
+
+def _solver(p: CSP,
+            propagation: str | None = None,
+            var_order: VariableOrder | None = None,
+            value_order: ValueOrder | None = None,
+            backjump: bool = False,
+            nogood_limit: int = 10_000,
+            stats: SearchStats | None = None,
+            hook: Hook | None = None) -> '_Solver':
+    if propagation not in (None, 'forward', 'ac3'):
+        raise ValueError(f'Unknown propagation mode {propagation!r}')
+
+    return _Solver(p, propagation, var_order or first_unassigned, value_order or in_order,
+                   backjump, nogood_limit if backjump else 0, stats, hook)
+
+
+def all_different(v: set[str]) -> set[AllDifferent]:
     '''Returns a set of constraints, stating that all variables in v must be different.'''
-    return {f'{x} != {y}' for x in v
-            for y in v
-            if x < y
-            }
+    return {AllDifferent(frozenset(v))}
+
+
+def first_unassigned(unassigned: list[Variable], domains: Domains, index: Index) -> Variable:  # pylint: disable=W0613
+    '''Chooses the first unassigned variable.'''
+    return unassigned[0]
+
+
+def minimum_remaining_values(unassigned: list[Variable], domains: Domains, index: Index) -> Variable:
+    '''Chooses the variable with the fewest values left in its domain.
+
+    Ties are broken by the degree heuristic: the variable sharing the most constraints with other unassigned
+    variables wins. Remaining ties are broken by the order of the variables. Without propagation the domains are
+    never pruned, so only the degree heuristic has an effect.
+    '''
+
+    fewest = min(len(domains[x]) for x in unassigned)
+    candidates = [x for x in unassigned if len(domains[x]) == fewest]
+    if len(candidates) == 1:
+        return candidates[0]
+
+    remaining = set(unassigned)
+    return max(candidates, key=lambda x: sum(1 for c in index[x] if any(y != x and y in remaining for y in _scope(c))))
+
+
+def in_order(var: Variable, candidates: list[Value], assignment: Assignment,  # pylint: disable=W0613
+             domains: Domains, index: Index) -> list[Value]:  # pylint: disable=W0613
+    '''Tries the values in the order they are given.'''
+    return candidates
+
 
+def least_constraining_value(var: Variable, candidates: list[Value], assignment: Assignment,
+                             domains: Domains, index: Index) -> list[Value]:
+    '''Tries those values first that rule out the fewest values of the neighbouring variables.'''
 
-def _collect_variables(expression: Formula) -> set[str]:
-    tree = ast.parse(expression)
+    def ruled_out(value: Value) -> int:
+        assignment[var] = value
+        try:
+            count = 0
+            for constraint in index[var]:
+                if isinstance(constraint, AllDifferent):
+                    count += sum(1 for y in constraint.variables if y not in assignment and value in domains[y])
+                    continue
+
+                unassigned = [x for x in constraint[1] if x not in assignment]
+                if len(unassigned) == 1:
+                    y = unassigned[0]
+                    count += sum(1 for w in domains[y] if not _supported(y, w, constraint, assignment, domains))
+            return count
+        finally:
+            del assignment[var]
+
+    return sorted(candidates, key=ruled_out)
+
+
+def _collect_variables(tree: ast.AST) -> set[str]:
     return {node.id for node in ast.walk(tree)
             if isinstance(node, ast.Name)
-            if node.id not in dir(__builtins__)
+            if not hasattr(builtins, node.id)
             }
 
 
-def _is_consistent(var: Variable, value: Value, assignment: Assignment, constraints: list[tuple[Formula, set[Variable]]]) -> bool:
-    new_assignment = assignment.copy()
-    new_assignment[var] = value
+def _compile(expression: Formula) -> Check:
+    '''Turns a formula into a function taking the values of its variables in alphabetical order.'''
+
+    tree = ast.parse(expression.strip(), mode='eval')
+    variables = tuple(sorted(_collect_variables(tree)))
+    arguments = ast.arguments(posonlyargs=[], args=[ast.arg(arg=x) for x in variables],
+                              kwonlyargs=[], kw_defaults=[], defaults=[])
+    function = ast.fix_missing_locations(ast.Expression(body=ast.Lambda(args=arguments, body=tree.body)))
+    return expression, variables, eval(compile(function, expression, 'eval'), {})  # pylint: disable=W0123
+
+
+def _counted(check: Predicate, name: str, counter: Counter[str]) -> Predicate:
+    '''Wraps check so that every evaluation is counted in counter[name].'''
+
+    def counted(*values: Value) -> bool:
+        counter[name] += 1
+        return check(*values)
+    return counted
+
+
+def _ordered(elements: set[Element] | list[Element]) -> list[Element]:
+    '''Returns the elements as a list. Sets are sorted so that the search is reproducible.'''
+
+    if isinstance(elements, list):
+        return elements
+    try:
+        return sorted(elements)
+    except TypeError:
+        return sorted(elements, key=repr)
+
+
+def _scope(constraint: Constraint) -> tuple[Variable, ...] | frozenset[Variable]:
+    return constraint.variables if isinstance(constraint, AllDifferent) else constraint[1]
+
+
+def _index(variables: list[Variable], constraints: list[Constraint]) -> Index:
+    index: Index = {x: [] for x in variables}
+    for constraint in constraints:
+        unknown = [x for x in _scope(constraint) if x not in index]
+        if unknown:
+            name = str(constraint) if isinstance(constraint, AllDifferent) else constraint[0]
+            raise ValueError(f'Constraint {name!r} uses unknown variables: {", ".join(map(str, unknown))}')
+        for x in _scope(constraint):
+            index[x].append(constraint)
+    return index
+
+
+def _supported(x: Variable, value: Value, constraint: Check, assignment: Assignment, domains: Domains) -> bool:
+    '''Checks whether x = value is compatible with constraint.
+
+    All other variables of constraint have to be assigned, except for at most one. The values of that variable are
+    taken from its domain, which is the check AC-3 needs for binary constraints.
+    '''
+
+    _, Vs, check = constraint
+    others = [y for y in Vs if y != x and y not in assignment]
+    if not others:
+        return check(*[value if y == x else assignment[y] for y in Vs])
+
+    y = others[0]
+    return any(check(*[value if z == x else w if z == y else assignment[z] for z in Vs]) for w in domains[y])
+
+
+def _prune(x: Variable, removed: set[Value], domains: Domains, trail: Trail) -> None:
+    '''Removes values from the domain of x and records them on the trail, so that they can be restored later.'''
+
+    domains[x] -= removed
+    trail.append((x, removed))
+
+
+def _restore(mark: int, domains: Domains, trail: Trail) -> None:
+    '''Undoes all domain changes recorded on the trail after position mark.'''
+
+    while len(trail) > mark:
+        x, removed = trail.pop()
+        domains[x] |= removed
+
+
+def _revise(x: Variable, constraint: Check, assignment: Assignment, domains: Domains, trail: Trail) -> bool:
+    '''Removes all values of x without support for constraint and returns True if the domain of x has changed.'''
+
+    removed = {value for value in domains[x] if not _supported(x, value, constraint, assignment, domains)}
+    if removed:
+        _prune(x, removed, domains, trail)
+    return bool(removed)
+
+
+def _ac3(queue: deque[tuple[Variable | None, Constraint]], assignment: Assignment, domains: Domains, index: Index,
+         trail: Trail) -> bool:
+    '''Processes the queue of arcs (x, c) until the domains are arc consistent.
+
+    Arcs of the form (None, c) stand for an all different constraint c, which is filtered as a whole.
+    '''
+
+    pending = set(queue)
+    while queue:
+        x, constraint = arc = queue.popleft()
+        pending.discard(arc)
+        if isinstance(constraint, AllDifferent):
+            changed = _filter_all_different(constraint, domains, trail)
+            if changed is None:
+                return False
+        elif _revise(x, constraint, assignment, domains, trail):
+            if not domains[x]:
+                return False
+            changed = [x]
+        else:
+            changed = []
+
+        for y in changed:
+            for arc in _arcs_to(y, constraint, assignment, index):
+                if arc not in pending:
+                    pending.add(arc)
+                    queue.append(arc)
+    return True
+
+
+def _arcs_to(x: Variable, changed: Constraint | None, assignment: Assignment,
+             index: Index) -> list[tuple[Variable | None, Constraint]]:
+    '''Returns the arcs that have to be revised after the domain of x has changed.
+
+    These are the arcs (y, c) of the binary constraints c between x and an unassigned variable y and the arcs
+    (None, c) of the all different constraints c on x.
+    '''
+
+    arcs: list[tuple[Variable | None, Constraint]] = []
+    for c in index[x]:
+        if c is changed:
+            continue
+        if isinstance(c, AllDifferent):
+            arcs.append((None, c))
+        elif len(c[1]) == 2:
+            arcs += [(y, c) for y in c[1] if y != x and y not in assignment]
+    return arcs
+
+
+def _initial_propagation(domains: Domains, index: Index, constraints: list[Constraint], ac3: bool) -> bool:
+    for constraint in constraints:
+        if not isinstance(constraint, AllDifferent) and len(constraint[1]) == 1:
+            _revise(constraint[1][0], constraint, {}, domains, [])
+    if any(not domain for domain in domains.values()):
+        return False
+
+    if not ac3:
+        return True
+    queue: deque[tuple[Variable | None, Constraint]] = deque()
+    for c in constraints:
+        if isinstance(c, AllDifferent):
+            queue.append((None, c))
+        elif len(c[1]) == 2:
+            queue.extend((x, c) for x in c[1])
+    return _ac3(queue, {}, domains, index, [])
+
+
+def _forward_check(var: Variable, assignment: Assignment, domains: Domains, index: Index, ac3: bool, trail: Trail) -> bool:
+    '''Prunes the domains of the variables that are the last unassigned variable of a constraint on var.
+
+    The value of var is removed from the domains of all variables that share an all different constraint with var.
+    '''
+
+    queue: deque[tuple[Variable | None, Constraint]] = deque()
+    for constraint in index[var]:
+        if isinstance(constraint, AllDifferent):
+            unassigned = [y for y in constraint.variables if y not in assignment and assignment[var] in domains[y]]
+            for y in unassigned:
+                _prune(y, {assignment[var]}, domains, trail)
+                if not domains[y]:
+                    return False
+            if ac3:
+                queue.append((None, constraint))
+                for y in unassigned:
+                    queue.extend(_arcs_to(y, constraint, assignment, index))
+            continue
+
+        unassigned = [x for x in constraint[1] if x not in assignment]
+        if len(unassigned) == 1 and _revise(unassigned[0], constraint, assignment, domains, trail):
+            if not domains[unassigned[0]]:
+                return False
+            if ac3:
+                queue.extend(_arcs_to(unassigned[0], None, assignment, index))
+
+    return _ac3(queue, assignment, domains, index, trail)
+
+
+def _filter_all_different(constraint: AllDifferent, domains: Domains, trail: Trail) -> list[Variable] | None:
+    '''Removes all values that are not part of any matching of the variables to pairwise different values.
+
+    This is the filtering algorithm of Régin: An edge x = v not in the maximum matching can be part of another
+    maximum matching iff it lies on an alternating path starting at a free value or on an alternating cycle.
+    Returns the variables whose domains have changed or None if there is no such matching at all.
+    '''
+
+    variables = sorted(constraint.variables)
+    match = _maximum_matching(variables, domains)
+    if len(match) < len(variables):
+        return None
+
+    owner = {value: x for x, value in match.items()}
+    # contract every variable with its matched value: v -> match[x] for each x != owner[v] with v in its domain
+    successors: dict[Value, list[Value]] = {}
+    for x in variables:
+        for value in domains[x]:
+            if owner.get(value) != x:
+                successors.setdefault(value, []).append(match[x])
+    free = [value for value in successors if value not in owner]
+    reachable = set(free)
+    stack = list(free)
+    while stack:
+        for value in successors.get(stack.pop(), []):
+            if value not in reachable:
+                reachable.add(value)
+                stack.append(value)
+    component = _strongly_connected(list(successors) + list(owner), successors)
+
+    changed = []
+    for x in variables:
+        removed = {value for value in domains[x] if value != match[x] and value not in reachable
+                   and component[value] != component[match[x]]}
+        if removed:
+            _prune(x, removed, domains, trail)
+            changed.append(x)
+    return changed
+
+
+def _maximum_matching(variables: list[Variable], domains: Domains) -> dict[Variable, Value]:
+    '''Matches the variables to pairwise different values of their domains using augmenting paths.
+
+    Stops at the first variable that cannot be matched, so the matching is complete iff it covers all variables.
+    '''
+
+    match: dict[Variable, Value] = {}
+    owner: dict[Value, Variable] = {}
+    for root in variables:
+        parent: dict[Variable, tuple[Variable, Value] | None] = {root: None}
+        queue = deque([root])
+        end = None
+        while queue and end is None:
+            x = queue.popleft()
+            for value in domains[x]:
+                y = owner.get(value)
+                if y is None:
+                    end = (x, value)
+                    break
+                if y not in parent:
+                    parent[y] = (x, value)
+                    queue.append(y)
+        if end is None:
+            return match
+
+        while end is not None:
+            x, value = end
+            match[x] = value
+            owner[value] = x
+            end = parent[x]
+    return match
+
+
+def _strongly_connected(nodes: list[Element], successors: dict[Element, list[Element]]) -> dict[Element, Element]:
+    '''Maps every node to a representative of its strongly connected component (iterative Tarjan).'''
+
+    number: dict[Element, int] = {}
+    low: dict[Element, int] = {}
+    component: dict[Element, Element] = {}
+    stack: list[Element] = []
+    for root in nodes:
+        if root in number:
+            continue
+        number[root] = low[root] = len(number)
+        stack.append(root)
+        work = [(root, iter(successors.get(root, [])))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in number:
+                    number[child] = low[child] = len(number)
+                    stack.append(child)
+                    work.append((child, iter(successors.get(child, []))))
+                    break
+                if child not in component:
+                    low[node] = min(low[node], number[child])
+            else:
+                work.pop()
+                if work:
+                    low[work[-1][0]] = min(low[work[-1][0]], low[node])
+                if low[node] == number[node]:
+                    while True:
+                        member = stack.pop()
+                        component[member] = node
+                        if member == node:
+                            break
+    return component
+
+
+_STOP: Event | None = None
+
+
+def _solve_parallel(p: CSP, workers: int, portfolio: bool, options: dict[str, Any]) -> Assignment | None:
+    stats = options.pop('stats', None)
+    if portfolio:
+        tasks = [({}, options | member) for member in _PORTFOLIO[:workers]]
+    else:
+        tasks = [(fixed, options) for fixed in _split(p, workers, options)]
+
+    solution = None
+    stop = multiprocessing.Event()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(stop,)) as pool:
+        futures = [pool.submit(_solve_subproblem, p, fixed, member, stats is not None) for (fixed, member) in tasks]
+        for future in as_completed(futures):
+            result, worker_stats = future.result()
+            if stats is not None and worker_stats is not None:
+                stats.merge(worker_stats)
+            if result is not None or portfolio:  # every member of the portfolio searches the whole CSP
+                solution = result
+                break
+        stop.set()
+        for future in futures:
+            future.cancel()
+    return solution
+
+
+_PORTFOLIO: list[dict[str, Any]] = [
+    {'var_order': minimum_remaining_values, 'value_order': in_order, 'backjump': False},
+    {'var_order': minimum_remaining_values, 'value_order': least_constraining_value, 'backjump': False},
+    {'var_order': first_unassigned, 'value_order': in_order, 'backjump': True},
+    {'var_order': minimum_remaining_values, 'value_order': in_order, 'backjump': True},
+    {'var_order': first_unassigned, 'value_order': in_order, 'backjump': False},
+    {'var_order': minimum_remaining_values, 'value_order': least_constraining_value, 'backjump': True},
+    {'var_order': first_unassigned, 'value_order': least_constraining_value, 'backjump': True},
+    {'var_order': first_unassigned, 'value_order': least_constraining_value, 'backjump': False},
+]
+
+
+def _split(p: CSP, workers: int, options: dict[str, Any]) -> list[Assignment]:
+    '''Fixes the most constrained variables to all combinations of their values, yielding about 4 tasks per worker.
+
+    The most constrained variables are those with the smallest domains after the initial propagation, ties are
+    broken by the number of constraints. Returns no task at all if the initial propagation already fails.
+    '''
+
+    solver = _solver(p, **options)
+    if not solver.initialize({}):
+        return []
+
+    ranked = sorted(solver.variables, key=lambda x: (len(solver.domains[x]), -len(solver.index[x])))
+    chosen: list[Variable] = []
+    size = 1
+    for x in ranked:
+        if size >= 4 * workers:
+            break
+        chosen.append(x)
+        size *= len(solver.domains[x])
+
+    candidates = [[value for value in solver.values if value in solver.domains[x]] for x in chosen]
+    return [dict(zip(chosen, values)) for values in product(*candidates)]
+
+
+def _init_worker(stop: Event) -> None:
+    global _STOP  # pylint: disable=W0603
+    _STOP = stop
+
+
+def _solve_subproblem(p: CSP, fixed: Assignment, options: dict[str, Any],
+                      collect: bool) -> tuple[Assignment | None, SearchStats | None]:
+    stats = SearchStats() if collect else None
+    solver = _solver(p, **options, stats=stats)
+    stop = _STOP.is_set if _STOP is not None else None
+    return next(solver.solve(fixed, stop), None), stats
+
+
+class _Solver:  # pylint: disable=R0902
+    def __init__(self, p: CSP, propagation: str | None, var_order: VariableOrder, value_order: ValueOrder,
+                 backjump: bool, nogood_limit: int, stats: SearchStats | None, hook: Hook | None):
+        self.stats = stats
+        self.hook = hook
+        start = time.perf_counter()
+        variables, values, constraints = p
+        self.variables = _ordered(variables)
+        self.values = _ordered(values)
+        self.constraints = [c if isinstance(c, AllDifferent) else _compile(c) for c in sorted(constraints, key=str)]
+        self.names = [str(c) if isinstance(c, AllDifferent) else c[0] for c in self.constraints]
+        if stats is not None:
+            self.constraints = [c if isinstance(c, AllDifferent) else (c[0], c[1], _counted(c[2], c[0], stats.evaluations))
+                                for c in self.constraints]
+        start = self._lap('parse', start)
+
+        self.index = _index(self.variables, self.constraints)
+        self.watch: dict[Variable, list[int]] = {x: [] for x in self.variables}
+        for i, constraint in enumerate(self.constraints):
+            for x in _scope(constraint):
+                self.watch[x].append(i)
+        self.unassigned = [len(_scope(c)) for c in self.constraints]
+        self._lap('index', start)
+        self.propagation = propagation
+        self.var_order = var_order
+        self.value_order = value_order
+        self.backjump = backjump
+        self.nogood_limit = nogood_limit
+        self.nogoods: OrderedDict[Nogood, None] = OrderedDict()
+        self.nogood_index: dict[tuple[Variable, Value], set[Nogood]] = {}
+
+        self.assignment: Assignment = {}
+        self.position = {x: i for i, x in enumerate(self.variables)}
+        self.cursor = 0  # every variable before it is assigned, only used with first_unassigned
+        self.domains: Domains = {}
+        self.initial_size: dict[Variable, int] = {}
+        self.trail: Trail = []
+
+    def solve(self, fixed: Assignment | None = None, stop: Callable[[], bool] | None = None) -> Iterator[Assignment]:
+        '''Enumerates the solutions that extend fixed. The search is abandoned as soon as stop returns True.'''
+
+        start = time.perf_counter()
+        consistent = self.initialize(fixed or {})
+        start = self._lap('propagation', start)
+        if not consistent:
+            return
+
+        for solution in self._search(stop):
+            self._lap('search', start)
+            yield solution
+            start = time.perf_counter()
+        self._lap('search', start)
+
+    def _lap(self, phase: str, start: float) -> float:
+        '''Adds the time since start to the given phase and returns the current time.'''
+
+        now = time.perf_counter()
+        if self.stats is not None:
+            self.stats.times[phase] = self.stats.times.get(phase, 0.0) + now - start
+        return now
+
+    def initialize(self, fixed: Assignment) -> bool:
+        '''Sets up the domains, restricting the variables in fixed to their values, and propagates them.'''
+
+        self.domains = {x: set(self.values) for x in self.variables}
+        self.cursor = 0
+        for x, value in fixed.items():
+            self.domains[x] &= {value}
+            if not self.domains[x]:
+                return False
+        if self.propagation is not None \
+                and not _initial_propagation(self.domains, self.index, self.constraints, self.propagation == 'ac3'):
+            return False
+        self.initial_size = {x: len(domain) for x, domain in self.domains.items()}
+        return True
+
+    def _search(self, stop: Callable[[], bool] | None) -> Iterator[Assignment]:
+        '''Backtracking with an explicit stack, a single assignment and a trail of domain changes.
+
+        Every frame of the stack holds a variable, an iterator over the values that are still to be tried and the
+        length of the trail before the variable has been assigned. When backjumping, conflicts[x] collects the
+        earlier variables whose values ruled out values of x.
+        '''
+
+        stack: list[tuple[Variable, Iterator[Value], int]] = []
+        level: dict[Variable, int] = {}
+        conflicts: dict[Variable, set[Variable]] = {}
+        nodes = 0
+
+        var = self._select()
+        while True:
+            nodes += 1
+            if stop is not None and nodes % 1024 == 0 and stop():
+                return
+            if var is None:
+                yield dict(self.assignment)
+                if self.backjump and stack:  # continue chronologically to find the other solutions
+                    conflicts[stack[-1][0]] |= self.assignment.keys() - {stack[-1][0]}
+            else:
+                level[var] = len(stack)
+                conflicts[var] = self._explain(var) if self.backjump else set()
+                stack.append((var, iter(self._order(var)), len(self.trail)))
+                if self.stats is not None and len(stack) > self.stats.max_depth:
+                    self.stats.max_depth = len(stack)
+
+            while stack:
+                var, values, mark = stack[-1]
+                if var in self.assignment:
+                    self._unassign(var, mark)
+                for value in values:
+                    conflict = self._assign(var, value)
+                    if conflict is None:
+                        if self.stats is not None:
+                            self.stats.nodes += 1
+                        if self.hook is not None:
+                            self.hook('assign', var, value)
+                        break
+                    conflicts[var] |= conflict
+                    if self.stats is not None:
+                        self.stats.failures[var] += 1
+                else:
+                    stack.pop()
+                    if self.backjump and not self._jump(conflicts.pop(var), stack, level, conflicts):
+                        return
+                    continue
+                break
+            else:
+                return
+            var = self._select()
+
+    def _select(self) -> Variable | None:
+        if self.var_order is first_unassigned:  # skip the O(n) scan, the cursor only moves back on undo
+            while self.cursor < len(self.variables) and self.variables[self.cursor] in self.assignment:
+                self.cursor += 1
+            return self.variables[self.cursor] if self.cursor < len(self.variables) else None
+        unassigned = [x for x in self.variables if x not in self.assignment]
+        return self.var_order(unassigned, self.domains, self.index) if unassigned else None
+
+    def _order(self, var: Variable) -> list[Value]:
+        candidates = [value for value in self.values if value in self.domains[var]]
+        return self.value_order(var, candidates, self.assignment, self.domains, self.index)
+
+    def _assign(self, var: Variable, value: Value) -> set[Variable] | None:
+        '''Assigns value to var and propagates it.
+
+        If this fails, everything is left unchanged and the assigned variables responsible for the failure are
+        returned. They are only computed when backjumping.
+        '''
+
+        violated = self._violated(var, value)
+        if violated is not None:
+            return self._blame(var, value, violated) if self.backjump else set()
+        nogood = self._matching_nogood(var, value)
+        if nogood is not None:
+            if self.stats is not None:
+                self.stats.nogood_hits += 1
+            return {x for (x, _) in nogood if x != var}
+
+        mark = len(self.trail)
+        self.assignment[var] = value
+        self._count(var, -1)
+        if self.propagation is not None:
+            _prune(var, self.domains[var] - {value}, self.domains, self.trail)
+            consistent = _forward_check(var, self.assignment, self.domains, self.index, self.propagation == 'ac3',
+                                        self.trail)
+            if self.stats is not None:
+                self.stats.prunes += sum(len(removed) for (_, removed) in self.trail[mark + 1:])
+            if not consistent:
+                conflict = self._explain_wipeout(var) if self.backjump else set()
+                self._undo(var, mark)
+                return conflict
+        return None
+
+    def _unassign(self, var: Variable, mark: int) -> None:
+        if self.hook is not None:
+            self.hook('backtrack', var, self.assignment[var])
+        self._undo(var, mark)
+
+    def _undo(self, var: Variable, mark: int) -> None:
+        del self.assignment[var]
+        self.cursor = min(self.cursor, self.position[var])
+        self._count(var, 1)
+        _restore(mark, self.domains, self.trail)
+
+    def _jump(self, conflict: set[Variable], stack: list[tuple[Variable, Iterator[Value], int]],
+              level: dict[Variable, int], conflicts: dict[Variable, set[Variable]]) -> bool:
+        '''Pops the stack up to the most recent variable in conflict and returns False if there is none.'''
+
+        if not conflict:
+            return False
+
+        self._learn(frozenset((x, self.assignment[x]) for x in conflict))
+        target = max(conflict, key=level.__getitem__)
+        if stack[-1][0] != target and self.stats is not None:
+            self.stats.backjumps += 1
+        while stack[-1][0] != target:
+            var, _, mark = stack.pop()
+            self._unassign(var, mark)
+            del conflicts[var]
+        conflicts[target] |= conflict - {target}
+        return True
+
+    def _learn(self, nogood: Nogood) -> None:
+        if self.nogood_limit <= 0:
+            return
+        if nogood in self.nogoods:
+            self.nogoods.move_to_end(nogood)
+            return
+
+        self.nogoods[nogood] = None
+        if self.stats is not None:
+            self.stats.nogoods_learned += 1
+        for pair in nogood:
+            self.nogood_index.setdefault(pair, set()).add(nogood)
+        if len(self.nogoods) > self.nogood_limit:
+            evicted, _ = self.nogoods.popitem(last=False)
+            for pair in evicted:
+                self.nogood_index[pair].discard(evicted)
+
+    def _matching_nogood(self, var: Variable, value: Value) -> Nogood | None:
+        '''Returns a learned nogood that would be completed by var = value.'''
+
+        for nogood in self.nogood_index.get((var, value), ()):
+            if all(x == var or (x in self.assignment and self.assignment[x] == w) for (x, w) in nogood):
+                self.nogoods.move_to_end(nogood)
+                return nogood
+        return None
+
+    def _explain(self, var: Variable) -> set[Variable]:
+        '''Returns assigned variables whose values explain the values pruned from the domain of var.'''
+
+        if self.propagation is None or len(self.domains[var]) == self.initial_size[var]:
+            return set()
+        if self.propagation == 'ac3':  # AC-3 prunes transitively, so every assigned variable may be involved
+            return set(self.assignment)
+        return {x for c in self.index[var] for x in _scope(c) if x in self.assignment}
 
-    return all(eval(f, new_assignment) for (f, Vs) in constraints  # pylint: disable=W0123
-               if var in Vs and Vs <= new_assignment.keys()
-               )
+    def _explain_wipeout(self, var: Variable) -> set[Variable]:
+        if self.propagation == 'ac3':
+            return set(self.assignment) - {var}
+        wiped = next(y for c in self.index[var] for y in _scope(c) if not self.domains[y])
+        return self._explain(wiped) - {var}
 
+    def _blame(self, var: Variable, value: Value, constraint: Constraint) -> set[Variable]:
+        if isinstance(constraint, AllDifferent):
+            return {y for y in constraint.variables if y in self.assignment and self.assignment[y] == value}
+        return set(constraint[1]) - {var}
 
-def _backtrack_search(assignment: Assignment, p: ACSP) -> Assignment | None:
-    variables, values, constraints = p
-    if len(assignment) == len(variables):
-        return assignment
+    def _count(self, var: Variable, delta: int) -> None:
+        for i in self.watch[var]:
+            self.unassigned[i] += delta
 
-    if isinstance(variables, set):
-        s = variables - assignment.keys()
-        var = s.pop() if s else None
-    else:  # if Variables is a list we choose the first unassigned variable
-        var = [x for x in variables if x not in assignment][0]
-    for value in values:
-        if _is_consistent(var, value, assignment, constraints):
-            new_assignment = assignment.copy()
-            new_assignment[var] = value
-            solution = _backtrack_search(new_assignment, p)
+    def _violated(self, var: Variable, value: Value) -> Constraint | None:
+        '''Checks the constraints on var that are fully assigned by var = value and returns one that is violated.
 
-            if solution is not None:
-                return solution
+        A formula is evaluated exactly when var is its last unassigned variable. All different constraints are
+        checked against those of their variables that are already assigned.
+        '''
 
-    return None
+        for i in self.watch[var]:
+            constraint = self.constraints[i]
+            if isinstance(constraint, AllDifferent):
+                if self.stats is not None:
+                    self.stats.evaluations[self.names[i]] += 1
+                if any(y in self.assignment and self.assignment[y] == value for y in constraint.variables):
+                    return constraint
+            elif self.unassigned[i] == 1:
+                _, Vs, check = constraint
+                if not check(*[value if x == var else self.assignment[x] for x in Vs]):
+                    return constraint
+        return None
@@ -0,0 +1,36 @@
+'''
+Benchmarks for the algorithms of this repository. Run a suite as a module from the repository root, e.g.
+
+    python -m benchmarks.search --output results.json
+'''
+
+import json
+import platform
+import subprocess
+import sys
+from typing import Any
+
+
+def commit_hash() -> str | None:
+    '''The commit the benchmarks are run on, recorded in their reports.'''
+
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_report(results: list[dict[str, Any]], output: str | None = None) -> None:
+    '''Writes the results of a suite together with the commit, Python version and machine as JSON to output or stdout.'''
+
+    report = {
+        'commit': commit_hash(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
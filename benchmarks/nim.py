@@ -0,0 +1,67 @@
+'''
+Benchmark of the two Nim engines on growing boards.
+
+The boards have the rows 1, 3, 5, ... as in the classic game. Alpha-beta search is run on growing boards until one
+takes longer than --budget seconds, its caches are cleared before every board. The nim-sum engine is run on the same
+boards and then on boards with up to thousands of rows of thousands of matches, generated with a fixed seed.
+
+    python -m benchmarks.nim --output results.json
+'''
+
+import argparse
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass
+
+import nim
+from benchmarks import write_report
+
+PLAYERS = ('A', 'B')
+
+
+@dataclass
+class Result:
+    engine: str
+    rows: int
+    matches: int
+    seconds: float
+    value: int
+
+
+def run(engine: str, rows: nim.Matches, repeat: int) -> Result:
+    seconds = float('inf')
+    for _ in range(repeat):
+        nim._alpha_beta_max.cache_clear()  # pylint: disable=W0212
+        nim._alpha_beta_min.cache_clear()  # pylint: disable=W0212
+        begin = time.perf_counter()
+        value, _ = nim._best_move((rows, 'A'), PLAYERS, engine=engine)  # pylint: disable=W0212
+        seconds = min(seconds, time.perf_counter() - begin)
+    return Result(engine, len(rows), sum(rows), seconds, value)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Compares the Nim engines.')
+    parser.add_argument('--output', '-o', help='JSON file to write, defaults to stdout')
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='timed runs per board, the best one counts')
+    parser.add_argument('--budget', type=float, default=10.0, help='seconds after which alpha-beta stops growing')
+    args = parser.parse_args(argv)
+
+    results = []
+    classic = [tuple(range(1, 2 * k, 2)) for k in range(1, 10)]
+    rng = random.Random(25)
+    large = [tuple(rng.randint(1_000, 5_000) for _ in range(k)) for k in (10, 100, 1_000, 5_000)]
+
+    for engine, boards in (('alpha-beta', classic), ('nim-sum', classic + large)):
+        for rows in boards:
+            result = run(engine, rows, 1 if engine == 'alpha-beta' else args.repeat)
+            print(f'{engine:10} {result.rows:5} rows {result.matches:9} matches {result.seconds:9.4f}s', file=sys.stderr)
+            results.append(asdict(result))
+            if result.seconds > args.budget:
+                break
+
+    write_report(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
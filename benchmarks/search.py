@@ -0,0 +1,176 @@
+'''
+Benchmarks for the search modules on fixed, seeded workloads.
+
+Every engine is run on every workload it can handle in reasonable time. The path-based depth-first search does
+not remember the states it has left, so it only gets the maze, whose paths form a tree. For every run the wall time
+(best of --repeat runs), the number of expanded states (calls of next_states), the peak memory allocated during the
+search (measured in a separate run with tracemalloc, which slows it down) and the length of the path are recorded.
+
+    python -m benchmarks.search --output results.json
+'''
+
+import argparse
+import contextlib
+import io
+import random
+import sys
+import time
+import tracemalloc
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Any, Callable
+
+import breadth_first_search
+import breadth_first_search_simple
+import depth_first_search
+import depth_first_search_simple
+import taoistic_search
+from benchmarks import write_report
+
+State = Any
+NextStates = Callable[[State], set[State]]
+Engine = Callable[[State, State, NextStates], list[State] | None]
+
+
+@dataclass
+class Workload:
+    name: str
+    start: State
+    goal: State
+    next_states: NextStates
+
+
+@dataclass
+class Result:
+    engine: str
+    workload: str
+    seconds: float
+    nodes: int
+    peak_memory: int  # bytes
+    path_length: int | None  # moves
+
+
+def _puzzle(n: int, moves: int, seed: int) -> Workload:
+    '''Scrambles the solved n x n sliding puzzle with random moves that do not undo the previous one.'''
+
+    goal = tuple(tuple(str(n * row + col) for col in range(n)) for row in range(n))
+    rng = random.Random(seed)
+    state, previous = goal, None
+    for _ in range(moves):
+        choices = sorted(s for s in taoistic_search._next_states(state) if s != previous)  # pylint: disable=W0212
+        previous, state = state, rng.choice(choices)
+    return Workload(f'puzzle-{n}x{n}', state, goal, taoistic_search._next_states)  # pylint: disable=W0212
+
+
+def _maze(n: int, seed: int) -> Workload:
+    '''A perfect n x n maze carved by a randomised depth-first search, solved from one corner to the other.'''
+
+    rng = random.Random(seed)
+    passages: dict[tuple[int, int], set[tuple[int, int]]] = {(r, c): set() for r in range(n) for c in range(n)}
+    stack = [(0, 0)]
+    seen = {(0, 0)}
+    while stack:
+        r, c = stack[-1]
+        neighbours = [(r + dr, c + dc) for (dr, dc) in ((1, 0), (-1, 0), (0, 1), (0, -1))
+                      if (r + dr, c + dc) in passages and (r + dr, c + dc) not in seen]
+        if neighbours:
+            cell = rng.choice(neighbours)
+            passages[(r, c)].add(cell)
+            passages[cell].add((r, c))
+            seen.add(cell)
+            stack.append(cell)
+        else:
+            stack.pop()
+
+    return Workload(f'maze-{n}x{n}', (0, 0), (n - 1, n - 1), passages.__getitem__)
+
+
+def _random_graph(n: int, degree: int, seed: int) -> Workload:
+    '''A random directed graph. The goal is a node at maximum distance from node 0.'''
+
+    rng = random.Random(seed)
+    edges = {i: set(rng.sample(range(n), degree)) for i in range(n)}
+    distance = {0: 0}
+    queue = deque([0])
+    while queue:
+        i = queue.popleft()
+        for j in sorted(edges[i]):
+            if j not in distance:
+                distance[j] = distance[i] + 1
+                queue.append(j)
+    goal = max(distance, key=lambda i: (distance[i], -i))
+    return Workload(f'random-graph-{n}', 0, goal, edges.__getitem__)
+
+
+def _taoistic(start: State, goal: State, next_states: NextStates) -> list[State] | None:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return taoistic_search._search(start, goal, next_states, taoistic_search._manhattan)  # pylint: disable=W0212
+
+
+def _bidirectional(start: State, goal: State, next_states: NextStates) -> list[State] | None:
+    return breadth_first_search.bidirectional_search(start, goal, next_states)
+
+
+WORKLOADS = [
+    _puzzle(3, 30, seed=1),
+    _puzzle(4, 14, seed=4),
+    _maze(60, seed=2),
+    _random_graph(20_000, 3, seed=3),
+]
+
+ENGINES: dict[str, tuple[Engine, list[str]]] = {
+    'breadth_first_search': (breadth_first_search.search, ['puzzle-3x3', 'puzzle-4x4', 'maze-60x60', 'random-graph-20000']),
+    'breadth_first_search.bidirectional': (_bidirectional, ['puzzle-3x3', 'puzzle-4x4', 'maze-60x60']),
+    'breadth_first_search_simple': (breadth_first_search_simple.search,
+                                    ['puzzle-3x3', 'puzzle-4x4', 'maze-60x60', 'random-graph-20000']),
+    'depth_first_search': (depth_first_search.search, ['maze-60x60']),
+    'depth_first_search.iddfs': (depth_first_search.iddfs, ['puzzle-3x3']),
+    'depth_first_search_simple': (depth_first_search_simple.search, ['puzzle-3x3', 'maze-60x60', 'random-graph-20000']),
+    'taoistic_search': (_taoistic, ['puzzle-3x3', 'puzzle-4x4']),
+}
+
+
+def run(engine: str, workload: Workload, repeat: int) -> Result:
+    search, _ = ENGINES[engine]
+    nodes = 0
+
+    def counting(state: State) -> set[State]:
+        nonlocal nodes
+        nodes += 1
+        return workload.next_states(state)
+
+    seconds = float('inf')
+    for _ in range(repeat):
+        nodes = 0
+        begin = time.perf_counter()
+        path = search(workload.start, workload.goal, counting)
+        seconds = min(seconds, time.perf_counter() - begin)
+
+    tracemalloc.start()
+    search(workload.start, workload.goal, workload.next_states)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return Result(engine, workload.name, seconds, nodes, peak, None if path is None else len(path) - 1)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmarks the search modules.')
+    parser.add_argument('--output', '-o', help='JSON file to write, defaults to stdout')
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='timed runs per benchmark, the best one counts')
+    parser.add_argument('--engine', '-e', action='append', choices=list(ENGINES), help='engines to run, defaults to all')
+    args = parser.parse_args(argv)
+
+    results = []
+    for engine in args.engine or ENGINES:
+        for workload in WORKLOADS:
+            if workload.name in ENGINES[engine][1]:
+                result = run(engine, workload, args.repeat)
+                print(f'{engine:36} {workload.name:20} {result.seconds:9.4f}s {result.nodes:9} nodes', file=sys.stderr)
+                results.append(asdict(result))
+
+    write_report(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,19 @@
 from collections import deque
 from typing import TypeVar, Callable
 
+from search_core import Goal, goal_test, path_to
+
 State = TypeVar('State')
 
 
-def search(start: State, goal: State, next_states: Callable[[State], set[State]]) -> list[State] | None:
+def search(start: State, goal: Goal[State], next_states: Callable[[State], set[State]]) -> list[State] | None:
+    is_goal = goal_test(goal)
     frontier = deque([start])
     parent = {start: start}
 
     while frontier:
         state = frontier.popleft()
-        if state == goal:
+        if is_goal(state):
             return path_to(state, parent)
 
         for ns in next_states(state):
@@ -21,6 +24,47 @@ def search(start: State, goal: State, next_states: Callable[[State], set[State]]
     return None
 
 
-def path_to(state: State, parent: dict[State, State]) -> list[State]:
-    p = parent[state]
-    return [state] if p == state else path_to(p, parent) + [state]
+def bidirectional_search(start: State,
+                         goal: State | set[State] | frozenset[State],
+                         next_states: Callable[[State], set[State]],
+                         prev_states: Callable[[State], set[State]] | None = None) -> list[State] | None:
+    '''Grows frontiers from start and from goal, which may be a set of states but not a predicate, until they meet.'''
+
+    if callable(goal) and not isinstance(goal, (set, frozenset)):
+        raise TypeError('bidirectional search needs goal states, not a predicate')
+
+    goals = list(goal) if isinstance(goal, (set, frozenset)) else [goal]
+    if not goals:
+        return None
+    if start in goals:
+        return [start]
+
+    forward, backward = {start: start}, {g: g for g in goals}
+    forward_frontier, backward_frontier = [start], goals
+
+    while forward_frontier and backward_frontier:
+        if len(forward_frontier) <= len(backward_frontier):
+            forward_frontier, meeting = _expand(forward_frontier, forward, backward, next_states)
+        else:
+            backward_frontier, meeting = _expand(backward_frontier, backward, forward, prev_states or next_states)
+
+        if meeting is not None:
+            return path_to(meeting, forward) + path_to(meeting, backward)[-2::-1]
+
+    return None
+
+
+def _expand(frontier: list[State],
+            parent: dict[State, State],
+            other: dict[State, State],
+            successors: Callable[[State], set[State]]) -> tuple[list[State], State | None]:
+    new_frontier = []
+    for state in frontier:
+        for ns in successors(state):
+            if ns not in parent:
+                parent[ns] = state
+                new_frontier.append(ns)
+                if ns in other:
+                    return new_frontier, ns
+
+    return new_frontier, None
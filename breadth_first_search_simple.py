@@ -1,23 +1,68 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from search_core import goal_test, path_to
+
+
 def search(start, goal, next_states):
-    frontier = {start}
-    visited = set()
+    is_goal = goal_test(goal)
+    if is_goal(start):
+        return [start]
+
+    frontier = [start]
     parent = {start: start}
 
     while frontier:
-        new_frontier = set()
+        new_frontier = []
         for s in frontier:
             for ns in next_states(s):
-                if ns not in visited and ns not in frontier:
-                    new_frontier.add(ns)
+                if ns not in parent:
+                    new_frontier.append(ns)
                     parent[ns] = s
 
-                    if ns == goal:
-                        return path_to(goal, parent)
+                    if is_goal(ns):
+                        return path_to(ns, parent)
 
-        visited |= frontier
         frontier = new_frontier
 
 
-def path_to(state, parent):
-    p = parent[state]
-    return [state] if p == state else path_to(p, parent) + [state]
+def parallel_search(start, goal, next_states, workers=None):
+    '''Like search, with next_states run in worker processes, so it must be a module-level function or a partial of one.'''
+
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        return search(start, goal, next_states)
+
+    is_goal = goal_test(goal)
+    if is_goal(start):
+        return [start]
+
+    parent = {start: start}
+    frontier = [start]
+
+    with ProcessPoolExecutor(workers) as pool:
+        while frontier:
+            parts = [[] for _ in range(workers)]
+            for s in frontier:
+                parts[hash(s) % workers].append(s)
+
+            new_frontier = []
+            for part, successors in zip(parts, pool.map(_expand, repeat(next_states), parts)):
+                for s, children in zip(part, successors):
+                    for ns in children:
+                        if ns not in parent:
+                            parent[ns] = s
+
+                            if is_goal(ns):
+                                return path_to(ns, parent)
+
+                            new_frontier.append(ns)
+
+            frontier = new_frontier
+
+    return None
+
+
+def _expand(next_states, states):
+    return [list(next_states(s)) for s in states]
@@ -1,24 +1,69 @@
-from typing import TypeVar, Callable
+from typing import Callable, Iterator, TypeVar
+
+from search_core import Goal, goal_test
 
 State = TypeVar('State')
 
 
-def search(start: State, goal: State, next_states: Callable[[State], set[State]]) -> list[State] | None:
-    return dfs(start, goal, next_states, [start], {start})
+def search(start: State,
+           goal: Goal[State],
+           next_states: Callable[[State], set[State]],
+           depth_limit: int | None = None) -> list[State] | None:
+    path, _ = dfs(start, goal, next_states, depth_limit)
+    return path
 
 
-def dfs(state: State,
-        goal: State,
-        next_states: Callable[[State], set[State]],
-        path: list[State],
-        path_set: set[State]) -> list[State] | None:
-    if state == goal:
-        return path
+def iddfs(start: State,
+          goal: Goal[State],
+          next_states: Callable[[State], set[State]],
+          max_depth: int | None = None) -> list[State] | None:
+    '''Iterative deepening: depth-limited searches with limits 0, 1, 2, ... until the goal is found.'''
 
-    for ns in next_states(state):
-        if ns not in path_set:
-            result = dfs(ns, goal, next_states, path + [ns], path_set | {ns})
-            if result:
-                return result
+    depth = 0
+    while max_depth is None or depth <= max_depth:
+        path, cut_off = dfs(start, goal, next_states, depth)
+        if path is not None or not cut_off:
+            return path
+        depth += 1
 
     return None
+
+
+def dfs(start: State,
+        goal: Goal[State],
+        next_states: Callable[[State], set[State]],
+        depth_limit: int | None = None) -> tuple[list[State] | None, bool]:
+    '''Returns the path (or None) and whether the depth limit cut off the search anywhere.'''
+
+    is_goal = goal_test(goal)
+    path = [start]
+    path_set = {start}
+    if is_goal(start):
+        return path, False
+
+    if depth_limit is not None and depth_limit <= 0:
+        return None, True
+
+    cut_off = False
+    successors: list[Iterator[State]] = [iter(next_states(start))]
+    while successors:
+        for ns in successors[-1]:
+            if ns not in path_set:
+                break
+        else:
+            successors.pop()
+            path_set.discard(path.pop())
+            continue
+
+        path.append(ns)
+        path_set.add(ns)
+        if is_goal(ns):
+            return path, cut_off
+
+        if depth_limit is not None and len(path) > depth_limit:
+            cut_off = True
+            path_set.discard(path.pop())
+        else:
+            successors.append(iter(next_states(ns)))
+
+    return None, cut_off
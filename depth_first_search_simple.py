@@ -1,4 +1,11 @@
+from search_core import goal_test, path_to
+
+
 def search(start, goal, next_states):
+    is_goal = goal_test(goal)
+    if is_goal(start):
+        return [start]
+
     stack = [start]
     parent = {start: start}
 
@@ -8,12 +15,7 @@ def search(start, goal, next_states):
             if ns not in parent:
                 parent[ns] = state
 
-                if ns == goal:
-                    return path_to(goal, parent)
+                if is_goal(ns):
+                    return path_to(ns, parent)
 
                 stack.append(ns)
-
-
-def path_to(state, parent):
-    p = parent[state]
-    return [state] if p == state else path_to(p, parent) + [state]
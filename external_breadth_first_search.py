@@ -0,0 +1,179 @@
+'''
+Breadth-first search with the layers kept on disk instead of in memory.
+
+States are encoded to byte strings of a fixed width. Each layer is a file of records (state, parent) sorted by
+state. To build the next layer, the successors of the current layer are collected in a bounded buffer, which is
+sorted and written to a run file whenever it is full. The runs are merged, duplicates are dropped and the states
+already contained in previous layers are removed by merging with their files. Only the buffer and one record per
+open file live in memory, the layer files are read through mmap.
+
+When a goal is reached, the path is rebuilt backwards by looking up each parent in the layer before it with a binary
+search.
+'''
+
+import heapq
+import mmap
+import os
+import tempfile
+from contextlib import ExitStack
+from typing import Callable, Iterable, Iterator, TypeVar
+
+from search_core import Goal, goal_test
+
+State = TypeVar('State')
+Record = tuple[bytes, bytes]  # encoded state and encoded parent
+
+
+def search(start: State,
+           goal: Goal[State],
+           next_states: Callable[[State], set[State]],
+           encode: Callable[[State], bytes],
+           decode: Callable[[bytes], State],
+           directory: str | None = None,
+           buffer: int = 1_000_000,
+           reversible: bool = False) -> list[State] | None:
+    '''Searches for a shortest path from start to a goal while keeping at most buffer successors in memory.
+
+    encode has to return byte strings of the same length for all states, e.g. bytes(int(t) for row in s for t in row)
+    for the states of taoistic_search, and decode has to invert it. The layer files are created in a temporary
+    directory below directory and are deleted afterwards. If every move can be undone, reversible may be set, so
+    duplicates only have to be looked for in the two previous layers instead of all of them.
+    '''
+
+    is_goal = goal_test(goal)
+    if is_goal(start):
+        return [start]
+
+    width = len(encode(start))
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        layers = [os.path.join(tmp, 'layer-0.bin')]
+        with open(layers[0], 'wb') as f:
+            f.write(encode(start) * 2)  # the start state is its own parent
+
+        while True:
+            runs = _expand(layers[-1], next_states, encode, decode, width, buffer)
+            layer = os.path.join(tmp, f'layer-{len(layers)}.bin')
+            previous = layers[-2:] if reversible else layers
+            found = None
+            size = 0
+            with ExitStack() as stack, open(layer, 'wb') as out:
+                merged = _unique(heapq.merge(*(_records(stack.enter_context(_MappedFile(r)), width) for r in runs)))
+                for p in previous:
+                    merged = _subtract(merged, _records(stack.enter_context(_MappedFile(p)), width))
+                for record in merged:
+                    out.write(record[0] + record[1])
+                    size += 1
+                    if is_goal(decode(record[0])):
+                        found = record
+                        break
+
+            for r in runs:
+                os.remove(r)
+            layers.append(layer)
+
+            if found is not None:
+                return _path_to(found, layers, decode, width)
+            if size == 0:
+                return None
+
+
+def _expand(layer: str,
+            next_states: Callable[[State], set[State]],
+            encode: Callable[[State], bytes],
+            decode: Callable[[bytes], State],
+            width: int,
+            buffer: int) -> list[str]:
+    '''Writes the successors of all states of layer to sorted run files and returns their names.'''
+
+    runs: list[str] = []
+    records: list[bytes] = []
+
+    def flush() -> None:
+        records.sort()
+        runs.append(f'{layer}.run-{len(runs)}')
+        with open(runs[-1], 'wb') as f:
+            f.writelines(records)
+        records.clear()
+
+    with _MappedFile(layer) as mm:
+        for state, _ in _records(mm, width):
+            for ns in next_states(decode(state)):
+                records.append(encode(ns) + state)
+                if len(records) >= buffer:
+                    flush()
+    if records:
+        flush()
+
+    return runs
+
+
+class _MappedFile:
+    '''Context manager mapping a whole file into memory read-only. Empty files are mapped to b''.'''
+
+    def __init__(self, name: str):
+        self.name = name
+        self.file = None
+        self.map: mmap.mmap | bytes = b''
+
+    def __enter__(self) -> mmap.mmap | bytes:
+        if os.path.getsize(self.name) > 0:
+            self.file = open(self.name, 'rb')  # pylint: disable=R1732
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    def __exit__(self, *_) -> None:
+        if self.file is not None:
+            self.map.close()
+            self.file.close()
+
+
+def _records(mm: mmap.mmap | bytes, width: int) -> Iterator[Record]:
+    size = 2 * width
+    for i in range(0, len(mm), size):
+        yield mm[i:i + width], mm[i + width:i + size]
+
+
+def _unique(records: Iterable[Record]) -> Iterator[Record]:
+    '''Drops records of states that were already seen in a sorted stream, keeping the first parent.'''
+
+    last = None
+    for record in records:
+        if record[0] != last:
+            last = record[0]
+            yield record
+
+
+def _subtract(records: Iterator[Record], layer: Iterator[Record]) -> Iterator[Record]:
+    '''Drops records of the states contained in a layer. Both streams have to be sorted.'''
+
+    other = next(layer, None)
+    for record in records:
+        while other is not None and other[0] < record[0]:
+            other = next(layer, None)
+        if other is None or other[0] != record[0]:
+            yield record
+
+
+def _parent(layer: str, state: bytes, width: int) -> bytes:
+    '''Looks up the parent of state in a layer file with a binary search.'''
+
+    size = 2 * width
+    with _MappedFile(layer) as mm:
+        lo, hi = 0, len(mm) // size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if mm[mid * size:mid * size + width] < state:
+                lo = mid + 1
+            else:
+                hi = mid
+        return mm[lo * size + width:(lo + 1) * size]
+
+
+def _path_to(record: Record, layers: list[str], decode: Callable[[bytes], State], width: int) -> list[State]:
+    state, parent = record
+    path = [state]
+    for layer in reversed(layers[:-1]):
+        path.append(parent)
+        parent = _parent(layer, parent, width)
+    path.reverse()
+    return [decode(s) for s in path]
@@ -9,10 +9,15 @@ There are four rows of matches:
 
 The player whose turn it is first selects a line. Then he takes any number of matches from this line.
 
-The player that takes the last match has won the game.
+The player that takes the last match has won the game. Under the misère rule, that player has lost instead.
+
+The computer finds its moves with the nim-sum, the XOR of all rows: the player to move wins if and only if it is not
+zero (under the misère rule, as long as some row has more than one match). This takes O(rows) time for any number
+and size of rows. Alpha-beta search over the whole game tree is kept to cross-check it on small boards.
 '''
 
-from functools import lru_cache
+from functools import lru_cache, reduce
+from operator import xor
 from os import system, name
 from random import choice
 
@@ -26,12 +31,12 @@ def _clear():
 
 
 @lru_cache(maxsize=None)
-def _alpha_beta_max(s: State, alpha: int, beta: int, players: tuple[str, str]) -> int:
+def _alpha_beta_max(s: State, alpha: int, beta: int, players: tuple[str, str], misere: bool = False) -> int:
     if _finished(s):
-        return _utility(s)
+        return _utility(s, misere)
 
     for ns in _next_states(s, players[0]):
-        value = _alpha_beta_min(ns, alpha, beta, players)
+        value = _alpha_beta_min(ns, alpha, beta, players, misere)
         if value >= beta:
             return value
         alpha = max(alpha, value)
@@ -40,12 +45,12 @@ def _alpha_beta_max(s: State, alpha: int, beta: int, players: tuple[str, str]) -
 
 
 @lru_cache(maxsize=None)
-def _alpha_beta_min(s: State, alpha: int, beta: int, players: tuple[str, str]) -> int:
+def _alpha_beta_min(s: State, alpha: int, beta: int, players: tuple[str, str], misere: bool = False) -> int:
     if _finished(s):
-        return _utility(s)
+        return _utility(s, misere)
 
     for ns in _next_states(s, players[1]):
-        value = _alpha_beta_max(ns, alpha, beta, players)
+        value = _alpha_beta_max(ns, alpha, beta, players, misere)
         if value <= alpha:
             return value
         beta = min(beta, value)
@@ -53,14 +58,61 @@ def _alpha_beta_min(s: State, alpha: int, beta: int, players: tuple[str, str]) -
     return beta
 
 
-def _best_move(s: State, players: tuple[str, str]) -> tuple[int, State]:
+def _best_move(s: State, players: tuple[str, str], misere: bool = False, engine: str = 'nim-sum') -> tuple[int, State]:
+    '''
+    Returns the value of s and a best move for players[0], who is to move. engine is 'nim-sum', 'alpha-beta' or
+    'check', which takes the move of the nim-sum and verifies it with alpha-beta search.
+    '''
+
+    if engine == 'alpha-beta':
+        return _alpha_beta_move(s, players, misere)
+    if engine not in ('nim-sum', 'check'):
+        raise ValueError(f'Unknown engine {engine!r}')
+
+    best_value, best_state = _nim_sum_move(s, players, misere)
+    if engine == 'check':
+        value = _alpha_beta_max(s, -1, 1, players, misere)
+        if value != best_value or _alpha_beta_min(best_state, -1, 1, players, misere) != value:
+            raise RuntimeError(f'Nim-sum and alpha-beta disagree on {s}')
+    return best_value, best_state
+
+
+def _alpha_beta_move(s: State, players: tuple[str, str], misere: bool = False) -> tuple[int, State]:
     next_states = _next_states(s, players[0])
-    best_value = _alpha_beta_max(s, -1, 1, players)
-    best_moves = [s for s in next_states if _alpha_beta_min(s, -1, 1, players) == best_value]
+    best_value = _alpha_beta_max(s, -1, 1, players, misere)
+    best_moves = [s for s in next_states if _alpha_beta_min(s, -1, 1, players, misere) == best_value]
     best_state = choice(best_moves)
     return best_value, best_state
 
 
+def _nim_sum_move(s: State, players: tuple[str, str], misere: bool = False) -> tuple[int, State]:
+    matches, _ = s
+    nim_sum = reduce(xor, matches, 0)
+    large = [i for i, row in enumerate(matches) if row > 1]
+
+    if misere and len(large) <= 1:
+        # Endgame: leave an odd number of rows with one match, taking the only larger row down to zero or one
+        ones = sum(1 for row in matches if row == 1)
+        if large:
+            i = large[0]
+            return 1, _take(s, i, matches[i] - (ones % 2 == 0), players)
+        value = 1 if ones % 2 == 0 else -1
+        return value, _take(s, matches.index(1), 1, players)
+
+    if nim_sum == 0:
+        # Lost against perfect play, just take a single match from the largest row
+        i = max(range(len(matches)), key=lambda i: matches[i])
+        return -1, _take(s, i, 1, players)
+
+    i = next(i for i, row in enumerate(matches) if row ^ nim_sum < row)
+    return 1, _take(s, i, matches[i] - (matches[i] ^ nim_sum), players)
+
+
+def _take(s: State, row: int, count: int, players: tuple[str, str]) -> State:
+    matches, _ = s
+    return matches[:row] + (matches[row] - count,) + matches[row + 1:], players[1]
+
+
 def _next_states(s: State, player: str) -> list[State]:
     matches, _ = s
     next_player = 'A' if player == 'B' else 'B'
@@ -73,14 +125,14 @@ def _next_states(s: State, player: str) -> list[State]:
     return states
 
 
-def _utility(s: State) -> int | None:
+def _utility(s: State, misere: bool = False) -> int | None:
     _, player = s
     if _finished(s):
         if player == 'A':
-            return -1
+            return 1 if misere else -1
 
         if player == 'B':
-            return 1
+            return -1 if misere else 1
 
         return 0  # Draw (not possible though)
     return None  # Not decided yet
@@ -105,11 +157,11 @@ def _get_move(s: State) -> State:
             print('Illegal input.')
 
 
-def _final_msg(s: State) -> bool:
+def _final_msg(s: State, misere: bool = False) -> bool:
     if _finished(s):
-        if _utility(s) == -1:
+        if _utility(s, misere) == -1:
             print('You have won!')
-        elif _utility(s) == 1:
+        elif _utility(s, misere) == 1:
             print('The computer has won!')
         else:
             print("It's a draw.")
@@ -128,18 +180,18 @@ def _print_board(s: State):
             print(f'{i}: {"X " * row}')
 
 
-def main():
+def main(rows: Matches = (1, 3, 5, 7), misere: bool = False, engine: str = 'nim-sum'):
     '''Play Nim.'''
 
-    state: State = ((1, 3, 5, 7), 'A')
+    state: State = (rows, 'A')
     players = ('A', 'B')
 
-    while not _final_msg(state):
-        val, state = _best_move(state, players)
+    while not _final_msg(state, misere):
+        val, state = _best_move(state, players, misere, engine)
         _print_board(state)
         print(f'For me, the game has the value {val}.')
 
-        if _final_msg(state):
+        if _final_msg(state, misere):
             return
 
         state = _get_move(state)
@@ -2,16 +2,38 @@
 Taoistic Search for the 15-puzzle.
 '''
 
+import argparse
 import heapq
-from typing import Callable
+import json
+import mmap
+import os
+import sys
+import time
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import cache, partial
+from itertools import count
+from math import perm
+from queue import Queue
+from threading import Thread
+from typing import Any, Callable, TextIO
+
+from search_core import SearchTree, path_to
 
 
 Row = tuple[str, ...]
 State = tuple[Row, ...]
 Move = tuple[int, int]
+Packed = int
 
 NxtStFct = Callable[[State], set[State]]
 Heuristic = Callable[[State, State], int]
+Matcher = Callable[[Any, Any], bool]
+Update = Callable[[Any, int, Any, Any], int]
+
+_PDB_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'taoistic_search')
 
 
 def _find_tile(tile: str, s: State) -> tuple[int, int] | None:
@@ -51,6 +73,72 @@ def _next_states(s: State) -> set[State]:
     return new_states
 
 
+@dataclass(frozen=True)
+class _Layout:
+    '''
+    Bit layout of packed n x n boards.
+
+    Cell i (counted row by row) is stored in the bits starting at shifts[i], the index of the blank's cell in the
+    lowest offset bits. A cell holds the number of its tile, 0 for the blank and all ones for the wildcard '*'.
+    '''
+
+    n: int
+    bits: int                                # per cell
+    offset: int                              # bits of the blank's index
+    shifts: tuple[int, ...]                  # of every cell
+    neighbours: tuple[tuple[int, ...], ...]  # cells next to every cell
+
+    @property
+    def wildcard(self) -> int:
+        return (1 << self.bits) - 1
+
+    @property
+    def blank(self) -> int:
+        '''Mask of the blank's index.'''
+        return (1 << self.offset) - 1
+
+
+@cache
+def _layout(n: int) -> _Layout:
+    offset = (n * n - 1).bit_length()
+    bits = (n * n).bit_length()
+    directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+    neighbours = []
+    for cell in range(n * n):
+        row, col = divmod(cell, n)
+        neighbours.append(tuple((row + dy) * n + col + dx for dx, dy in directions
+                                if row + dy in range(n) and col + dx in range(n)))
+
+    return _Layout(n, bits, offset, tuple(offset + i * bits for i in range(n * n)), tuple(neighbours))
+
+
+def _pack(s: State) -> Packed:
+    layout = _layout(len(s))
+    p = 0
+    for i, tile in enumerate(tile for row in s for tile in row):
+        if tile == '0':
+            p |= i
+        p |= (layout.wildcard if tile == '*' else int(tile)) << layout.shifts[i]
+    return p
+
+
+def _unpack(p: Packed, layout: _Layout) -> State:
+    tiles = [(p >> shift) & layout.wildcard for shift in layout.shifts]
+    return tuple(tuple('*' if tile == layout.wildcard else str(tile) for tile in tiles[row * layout.n:(row + 1) * layout.n])
+                 for row in range(layout.n))
+
+
+def _next_packed(p: Packed, layout: _Layout) -> list[Packed]:
+    '''Moves the blank to each of its neighbour cells, which takes a few bit operations per move.'''
+
+    blank = p & layout.blank
+    result = []
+    for cell in layout.neighbours[blank]:
+        tile = (p >> layout.shifts[cell]) & layout.wildcard
+        result.append(p + (tile << layout.shifts[blank]) - (tile << layout.shifts[cell]) - blank + cell)
+    return result
+
+
 def _matches(pattern: State, s: State) -> bool:
     for i, single_pattern in enumerate(pattern):
         for j, char in enumerate(single_pattern):
@@ -60,6 +148,220 @@ def _matches(pattern: State, s: State) -> bool:
     return True
 
 
+@dataclass(frozen=True)
+class _Goal:
+    '''A pattern prepared for packed states.'''
+
+    layout: _Layout
+    mask: Packed             # bits of the cells that are not wildcards
+    value: Packed            # contents of these cells
+    cells: tuple[int, ...]   # goal cell of every tile code, -1 for the blank and tiles not in the pattern
+    distance: tuple[tuple[int, ...], ...]  # Manhattan distance of every tile code in every cell to its goal cell
+    databases: tuple['_PatternDatabase', ...] = ()
+
+
+def _goal(pattern: State, groups: list[list[str]] | None = None, directory: str | None = None) -> _Goal:
+    '''
+    Prepares a pattern. Pattern databases are loaded for groups, which must be disjoint groups of its tiles, from
+    directory (see _pdb_directory).
+    '''
+
+    layout = _layout(len(pattern))
+    n = layout.n
+    mask = value = 0
+    cells = [-1] * (layout.wildcard + 1)
+    for i, tile in enumerate(tile for row in pattern for tile in row):
+        if tile != '*':
+            mask |= layout.wildcard << layout.shifts[i]
+            value |= int(tile) << layout.shifts[i]
+            if tile != '0':
+                cells[int(tile)] = i
+
+    distance = tuple(tuple(0 if target < 0 else abs(i // n - target // n) + abs(i % n - target % n) for i in range(n * n))
+                     for target in cells)
+    databases = []
+    for group in groups or []:
+        tiles = tuple(int(tile) for tile in group if tile != '0')
+        databases.append(_pattern_database(n, tiles, tuple(cells[tile] for tile in tiles), _pdb_directory(directory)))
+    return _Goal(layout, mask, value, tuple(cells), distance, tuple(databases))
+
+
+def _matches_packed(goal: _Goal, p: Packed) -> bool:
+    return p & goal.mask == goal.value
+
+
+def _manhattan_packed(p: Packed, goal: _Goal) -> int:
+    wildcard = goal.layout.wildcard
+    return sum(goal.distance[(p >> shift) & wildcard][i] for i, shift in enumerate(goal.layout.shifts))
+
+
+def _manhattan_update(p: Packed, h: int, ns: Packed, goal: _Goal) -> int:
+    '''Manhattan distance of the successor ns of p, given the distance h of p: only the moved tile changes it.'''
+
+    layout = goal.layout
+    blank, cell = p & layout.blank, ns & layout.blank
+    tile = (p >> layout.shifts[cell]) & layout.wildcard
+    return h + goal.distance[tile][blank] - goal.distance[tile][cell]
+
+
+def _conflicts(p: Packed, goal: _Goal, line: int, vertical: bool) -> int:
+    '''
+    Number of tiles that have to leave a row (or column if vertical) so that the other tiles in their goal row can
+    pass each other. Each of them costs two extra moves on top of the Manhattan distance.
+    '''
+
+    layout = goal.layout
+    n = layout.n
+    cells = range(line, n * n, n) if vertical else range(line * n, line * n + n)
+    increasing: list[int] = []  # smallest last goal cell of an increasing sequence of each length
+    in_line = 0
+    for cell in cells:
+        target = goal.cells[(p >> layout.shifts[cell]) & layout.wildcard]
+        if target >= 0 and (target % n if vertical else target // n) == line:
+            in_line += 1
+            k = bisect_left(increasing, target)
+            increasing[k:k + 1] = [target]
+    return in_line - len(increasing)
+
+
+def _linear_conflict(p: Packed, goal: _Goal) -> int:
+    n = goal.layout.n
+    conflicts = sum(_conflicts(p, goal, line, False) + _conflicts(p, goal, line, True) for line in range(n))
+    return _manhattan_packed(p, goal) + 2 * conflicts
+
+
+def _linear_conflict_update(p: Packed, h: int, ns: Packed, goal: _Goal) -> int:
+    '''
+    Linear conflict of the successor ns of p. A vertical move only changes the tiles in the two rows involved and
+    cannot change the order of the tiles in a column, and vice versa.
+    '''
+
+    n = goal.layout.n
+    blank, cell = p & goal.layout.blank, ns & goal.layout.blank
+    vertical = blank % n != cell % n
+    lines = {blank % n, cell % n} if vertical else {blank // n, cell // n}
+    h = _manhattan_update(p, h, ns, goal)
+    for line in lines:
+        h += 2 * (_conflicts(ns, goal, line, vertical) - _conflicts(p, goal, line, vertical))
+    return h
+
+
+@dataclass(frozen=True)
+class _PatternDatabase:
+    '''
+    Exact number of moves of a group of tiles needed to bring them from any cells to their goal cells, where moves
+    of other tiles are free. The distances of disjoint groups may therefore be added up. They are stored as one byte
+    per arrangement of the group, indexed by _rank of the cells of its tiles.
+    '''
+
+    tiles: tuple[int, ...]
+    distances: mmap.mmap | bytes
+
+
+def _rank(cells: list[int] | tuple[int, ...], size: int) -> int:
+    '''Perfect hash of distinct cells out of size cells onto 0, ..., perm(size, len(cells)) - 1.'''
+
+    index = 0
+    for i, cell in enumerate(cells):
+        index = index * (size - i) + cell - sum(1 for c in cells[:i] if c < cell)
+    return index
+
+
+def _pdb_directory(directory: str | None = None) -> str:
+    '''directory if given, else the environment variable TAOISTIC_SEARCH_PDB_DIRECTORY if set, else _PDB_DIRECTORY.'''
+
+    return directory or os.environ.get('TAOISTIC_SEARCH_PDB_DIRECTORY') or _PDB_DIRECTORY
+
+
+@cache
+def _pattern_database(n: int, tiles: tuple[int, ...], goal_cells: tuple[int, ...], directory: str) -> _PatternDatabase:
+    '''Loads the pattern database of tiles from directory, building and saving it first if it does not exist yet.'''
+
+    name = os.path.join(directory, f'{n}x{n}-' + '-'.join(f'{t}@{c}' for t, c in zip(tiles, goal_cells)) + '.pdb')
+    if not os.path.exists(name):
+        os.makedirs(directory, exist_ok=True)
+        with open(f'{name}.{os.getpid()}', 'wb') as f:
+            f.write(_build_pattern_database(n, goal_cells))
+        os.replace(f'{name}.{os.getpid()}', name)
+
+    with open(name, 'rb') as f:
+        return _PatternDatabase(tiles, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def _build_pattern_database(n: int, goal_cells: tuple[int, ...]) -> bytearray:
+    '''
+    Breadth-first search backwards from the goal over the arrangements of a group of tiles together with the blank.
+    Moving a tile of the group costs one, moving any other tile is free, so this is a 0-1 BFS with a deque. The
+    distance of an arrangement is the smallest over all cells of the blank.
+    '''
+
+    size = n * n
+    neighbours = _layout(n).neighbours
+    best = bytearray(b'\xff') * (perm(size, len(goal_cells)) * size)
+    queue: deque[tuple[tuple[int, ...], int, int]] = deque()
+    for blank in range(size):
+        if blank not in goal_cells:
+            best[_rank(goal_cells, size) * size + blank] = 0
+            queue.append((goal_cells, blank, 0))
+
+    while queue:
+        cells, blank, d = queue.popleft()
+        if best[_rank(cells, size) * size + blank] < d:
+            continue
+        for cell in neighbours[blank]:
+            if cell in cells:
+                j = cells.index(cell)
+                moved, cost = cells[:j] + (blank,) + cells[j + 1:], d + 1
+            else:
+                moved, cost = cells, d
+            i = _rank(moved, size) * size + cell
+            if cost < best[i]:
+                best[i] = cost
+                if cost == d:
+                    queue.appendleft((moved, cell, cost))
+                else:
+                    queue.append((moved, cell, cost))
+
+    return bytearray(min(best[i:i + size]) for i in range(0, len(best), size))
+
+
+def _tile_cells(p: Packed, layout: _Layout) -> list[int]:
+    '''Cell of every tile code in p.'''
+
+    cells = [0] * (layout.wildcard + 1)
+    for i, shift in enumerate(layout.shifts):
+        cells[(p >> shift) & layout.wildcard] = i
+    return cells
+
+
+def _pdb(p: Packed, goal: _Goal) -> int:
+    cells = _tile_cells(p, goal.layout)
+    return sum(db.distances[_rank([cells[tile] for tile in db.tiles], len(goal.layout.shifts))] for db in goal.databases)
+
+
+def _pdb_update(p: Packed, h: int, ns: Packed, goal: _Goal) -> int:
+    '''Only the entry of the moved tile's group changes, and none does if a wildcard was moved.'''
+
+    layout = goal.layout
+    tile = (p >> layout.shifts[ns & layout.blank]) & layout.wildcard
+    for db in goal.databases:
+        if tile in db.tiles:
+            cells = _tile_cells(p, layout)
+            group = [cells[t] for t in db.tiles]
+            old = db.distances[_rank(group, len(layout.shifts))]
+            group[db.tiles.index(tile)] = p & layout.blank
+            return h - old + db.distances[_rank(group, len(layout.shifts))]
+    return h
+
+
+# Admissible heuristics for packed states, each with its incremental update
+_HEURISTICS: dict[str, tuple[Heuristic, Update]] = {
+    'manhattan': (_manhattan_packed, _manhattan_update),
+    'linear-conflict': (_linear_conflict, _linear_conflict_update),
+    'pdb': (_pdb, _pdb_update),
+}
+
+
 def _manhattan(s1: State, s2: State) -> int:
     n = len(s1)
     result = 0
@@ -161,79 +463,387 @@ def _state_to_string(s: State) -> str:
     return result
 
 
-def _search(start: State, goal: State, next_states: NxtStFct, heuristic: Heuristic) -> list[State] | None:
-    visited: set[State] = set()
-    priority_queue = [(heuristic(start, goal), [start])]
-    while len(priority_queue) > 0:
-        _, path = heapq.heappop(priority_queue)
-        state = path[-1]
-        if state in visited:
+def _search(start: State, goal: State, next_states: NxtStFct, heuristic: Heuristic,
+            matches: Matcher = _matches, update: Update | None = None, verbose: bool = True) -> list[State] | None:
+    '''
+    A* search. The heap only holds (f, -g, tie-breaker, id) entries, so deeper states come first on equal f and
+    states are never compared. The states are interned in a search tree with parent pointers, from which the path is
+    rebuilt at the end. best_g holds the cheapest known cost of every state, heap entries superseded by a cheaper
+    one are skipped when they are popped.
+    '''
+
+    tree = SearchTree(start)
+    best_g = {0: 0}
+    visited: set[int] = set()
+    tie = count()
+    priority_queue = [(heuristic(start, goal), 0, next(tie), 0)]
+    while priority_queue:
+        f, g, _, i = heapq.heappop(priority_queue)
+        g = -g
+        if i in visited or g > best_g[i]:
             continue
-        if _matches(goal, state):
-            print(f'Number of states visited: {len(visited)}')
-            return path
+        state = tree.states[i]
+        if matches(goal, state):
+            if verbose:
+                print(f'Number of states visited: {len(visited)}')
+            return tree.path_to(state)
+        visited.add(i)
+
         for ns in next_states(state):
-            if ns not in visited:
-                priority = heuristic(ns, goal) + len(path)
-                heapq.heappush(priority_queue, (priority, path + [ns]))
-        visited.add(state)
+            j = tree.ids.get(ns)
+            if j is None:
+                j = tree.add(ns, i)
+            elif j in visited or best_g[j] <= g + 1:
+                continue
+            else:
+                tree.parents[j] = i
+            best_g[j] = g + 1
+            h = heuristic(ns, goal) if update is None else update(state, f - g, ns, goal)
+            heapq.heappush(priority_queue, (g + 1 + h, -g - 1, next(tie), j))
     return None
 
 
+def _ida_search(start: State, goal: State, next_states: NxtStFct, heuristic: Heuristic,
+                matches: Matcher = _matches, update: Update | None = None,
+                table_size: int = 1 << 20, verbose: bool = True) -> list[State] | None:
+    '''
+    Iterative-deepening A*: depth-first searches that cut off every state with f = g + h above a bound, which is
+    raised to the smallest f cut off until the goal is found. Apart from the transposition table, memory is linear in
+    the depth of the solution.
+
+    The transposition table remembers the smallest g with which each state was searched under the current bound.
+    Reaching it again with no smaller g cannot lead anywhere new, so that subtree is skipped. It holds at most
+    table_size states, the oldest entry is replaced when it is full. A table_size of 0 disables it.
+    '''
+
+    h = heuristic(start, goal)
+    if matches(goal, start):
+        if verbose:
+            print('Number of states visited: 0')
+        return [start]
+
+    visited = 0
+    bound = h
+    while True:
+        path, estimates, on_path = [start], [h], {start}
+        successors = [iter(next_states(start))]
+        table: OrderedDict[State, int] = OrderedDict()
+        next_bound = None
+        visited += 1
+        while successors:
+            for ns in successors[-1]:
+                if ns in on_path:
+                    continue
+                g = len(path)
+                ns_h = heuristic(ns, goal) if update is None else update(path[-1], estimates[-1], ns, goal)
+                if g + ns_h > bound:
+                    next_bound = g + ns_h if next_bound is None else min(next_bound, g + ns_h)
+                    continue
+                if table_size:
+                    if table.get(ns, g + 1) <= g:
+                        continue
+                    table.pop(ns, None)
+                    if len(table) >= table_size:
+                        table.popitem(last=False)
+                    table[ns] = g
+                if matches(goal, ns):
+                    if verbose:
+                        print(f'Number of states visited: {visited}')
+                    return path + [ns]
+                break
+            else:
+                successors.pop()
+                on_path.discard(path.pop())
+                estimates.pop()
+                continue
+
+            path.append(ns)
+            estimates.append(ns_h)
+            on_path.add(ns)
+            successors.append(iter(next_states(ns)))
+            visited += 1
+
+        if next_bound is None:
+            return None
+        bound = next_bound
+
+
+# Search engines for the pattern stages of _main
+_ENGINES = {
+    'astar': _search,
+    'idastar': _ida_search,
+}
+
+
 def _draw_state(s: State) -> None:
     print(_state_to_string(s))
 
 
-def _shorten(solution: list[State]) -> list[State]:
+def _shorten(solution: list[State], window: int = 0, next_states: NxtStFct = _next_states) -> list[State]:
+    '''
+    Removes every loop from a solution: from each state it continues right after the last occurrence of that state,
+    which takes linear time. If window is positive, each state is also connected to the states up to window moves
+    further on by a breadth-first search, and the part in between is replaced whenever the search finds a shorter
+    way.
+    '''
+
+    shorter = _remove_loops(solution)
+    if window > 0:
+        shorter = _remove_loops(_shortcut(shorter, window, next_states))
+    return shorter
+
+
+def _remove_loops(solution: list[State]) -> list[State]:
+    last = {state: i for i, state in enumerate(solution)}
     shorter = []
     k = 0
-    while k < len(solution) - 1:
+    while k < len(solution):
         shorter.append(solution[k])
-        if k + 2 < len(solution) and solution[k] == solution[k + 2]:
-            k += 3
-        else:
-            k += 1
-    shorter += [solution[-1]]
+        k = last[solution[k]] + 1
+    return shorter
+
+
+def _shortcut(solution: list[State], window: int, next_states: NxtStFct) -> list[State]:
+    shorter = list(solution)
+    i = 0
+    while i < len(shorter) - 2:
+        ahead = {state: j for j, state in enumerate(shorter[i + 2:i + window + 1], i + 2)}
+        parent = {shorter[i]: shorter[i]}
+        frontier = [shorter[i]]
+        saved, target = 0, None  # most moves saved so far and the state of the solution reached for it
+        for depth in range(1, window):
+            new_frontier = []
+            for state in frontier:
+                for ns in next_states(state):
+                    if ns not in parent:
+                        parent[ns] = state
+                        new_frontier.append(ns)
+                        j = ahead.get(ns)
+                        if j is not None and j - i - depth > saved:
+                            saved, target = j - i - depth, ns
+            frontier = new_frontier
+
+        if target is not None:
+            shorter[i:ahead[target] + 1] = path_to(target, parent)
+        i += 1
     return shorter
 
 
-def _main(start: State, goal: State) -> list[State] | None:
-    tiles = [['14', '15'],
-             ['12', '13'],
-             ['10', '11'],
-             ['8',  '9'],
-             ['3',  '7'],
-             ['2',  '6'],
-             ['0', '1', '4', '5']
-             ]
-    patterns = _intermediate_goals(goal, tiles)
+def _tile_groups(n: int) -> list[list[str]]:
+    '''
+    Groups of tiles for an n x n board, brought into place one after the other: the bottom rows in pairs from the
+    right until two rows are left, then their columns in vertical pairs from the right until the top left 2 x 2 block
+    is left. For the 15-puzzle these are [14, 15], [12, 13], [10, 11], [8, 9], [3, 7], [2, 6] and [0, 1, 4, 5].
+    '''
+
+    groups = []
+    for row in range(n - 1, 1, -1):
+        for col in range(n - 2, -2, -2):
+            groups.append([str(row * n + c) for c in range(max(col, 0), col + 2)])
+    for col in range(n - 1, 1, -1):
+        groups.append([str(col), str(n + col)])
+    groups.append(['0', '1', str(n), str(n + 1)])
+    return groups
+
+
+@cache
+def _stages(goal: State, tiles: tuple[tuple[str, ...], ...], heuristic: str,
+            directory: str | None = None) -> list[tuple[State, _Goal]]:
+    '''
+    The pattern of every stage together with its preparation, built once per goal, tile groups, heuristic and
+    pattern database directory.
+    '''
+
+    groups = [list(group) for group in tiles]
+    patterns = _intermediate_goals(goal, groups)
+    return [(pattern, _goal(pattern, groups[:stage + 1] if heuristic == 'pdb' else None, directory))
+            for stage, pattern in enumerate(patterns)]
+
+
+def _main(start: State, goal: State, heuristic: str = 'manhattan', engine: str | list[str] = 'astar',
+          tiles: list[list[str]] | None = None, table_size: int = 1 << 20, pdb_directory: str | None = None,
+          verbose: bool = True) -> list[State] | None:
+    '''
+    Solves the puzzle in stages, each one bringing one more group of tiles into place. engine is the search engine
+    of all stages or a list with one engine per stage. tiles defaults to _tile_groups of the board. The heuristic
+    'pdb' adds up the pattern databases of the groups, which are built on first use and cached in pdb_directory
+    (see _pdb_directory). table_size is the number of entries of the transposition table of 'idastar'. Unless
+    verbose is set, nothing is printed. Returns None if a stage fails or the last one does not end in goal.
+    '''
+
+    stages = _stages(goal, tuple(tuple(group) for group in tiles or _tile_groups(len(goal))), heuristic, _pdb_directory(pdb_directory))
+    engines = [engine] * len(stages) if isinstance(engine, str) else engine
+    if len(engines) != len(stages):
+        raise ValueError(f'{len(engines)} engines given for {len(stages)} stages')
+    layout = _layout(len(start))
+    estimate, update = _HEURISTICS[heuristic]
     state = start
     solution = []
 
-    print('Start state:')
-    _draw_state(start)
-    for pattern in patterns:
-        print('Trying to reach the following pattern:')
-        _draw_state(pattern)
-        tiles = _find_numbers(pattern)
-        extended_state = _replace_numbers(state, tiles + ['0'])
-        path = _search(extended_state, pattern, _next_states, _manhattan)
+    if verbose:
+        print('Start state:')
+        _draw_state(start)
+    for (pattern, prepared), name in zip(stages, engines):
+        if verbose:
+            print('Trying to reach the following pattern:')
+            _draw_state(pattern)
+        numbers = _find_numbers(pattern)
+        extended_state = _replace_numbers(state, numbers + ['0'])
+        search = _ENGINES[name]
+        options = {'table_size': table_size} if search is _ida_search else {}
+        path = search(_pack(extended_state), prepared, partial(_next_packed, layout=layout), estimate, _matches_packed,
+                      update, verbose=verbose, **options)
+        if path:
+            path = [_unpack(p, layout) for p in path]
 
-        print(path)
+        if verbose:
+            print(path)
         if path:
             moves = _extract_move_list(path)
             path = _apply_move_list(state, moves)
-            print(f'The following state is reached after {len(path)-1} steps:')
             state = path[-1]
-            _draw_state(state)
+            if verbose:
+                print(f'The following state is reached after {len(path)-1} steps:')
+                _draw_state(state)
             solution += path[:-1]
         else:
             return None
-    solution += [goal]
-    return solution
+    return solution + [goal] if state == goal else None
+
+
+_OPTIONS: dict[str, Any] = {}  # of the batch workers
+
+
+def _board(rows: list[list[int | str]]) -> State:
+    '''Converts rows of tile numbers to a state, checking that they form a square board of the tiles 0 to n^2 - 1.'''
+
+    board = tuple(tuple(str(tile) for tile in row) for row in rows)
+    n = len(board)
+    if n < 2 or any(len(row) != n for row in board) \
+            or sorted(tile for row in board for tile in row) != sorted(str(i) for i in range(n * n)):
+        raise ValueError(f'Not a square board of the tiles 0 to n^2 - 1: {rows}')
+    return board
+
+
+def _solved(n: int) -> State:
+    return tuple(tuple(str(row * n + col) for col in range(n)) for row in range(n))
+
+
+def _solvable(start: State, goal: State) -> bool:
+    '''
+    Every move swaps the blank with a tile, so goal can be reached iff the parity of the permutation between the
+    boards equals the parity of the distance between the blank's cells.
+    '''
+
+    cells = {tile: i for i, tile in enumerate(tile for row in goal for tile in row)}
+    permutation = [cells[tile] for row in start for tile in row]
+    swaps = 0
+    for i, j in enumerate(permutation):
+        while j != i:
+            permutation[i], permutation[j] = permutation[j], j
+            j = permutation[i]
+            swaps += 1
+    (r1, c1), (r2, c2) = _find_tile('0', start), _find_tile('0', goal)
+    return swaps % 2 == (abs(r1 - r2) + abs(c1 - c2)) % 2
+
+
+def _init_batch(heuristic: str, engine: str, window: int, table_size: int, pdb_directory: str | None) -> None:
+    _OPTIONS.update(heuristic=heuristic, engine=engine, window=window, table_size=table_size, pdb_directory=pdb_directory)
+
+
+def _solve_board(line: str) -> str:
+    '''
+    Solves one board given as a JSON line, either a list of rows or an object with the keys start and optionally id
+    and goal. Returns a JSON line with the moves of the blank as [dx, dy] pairs after shortening, their number
+    before and after shortening and the time taken. A board that cannot be read gives a line with its id and error.
+    '''
+
+    task = None
+    try:
+        task = json.loads(line)
+        if not isinstance(task, dict):
+            task = {'start': task}
+        start = _board(task['start'])
+        goal = _board(task['goal']) if 'goal' in task else _solved(len(start))
+        if len(goal) != len(start):
+            raise ValueError(f'The goal is {len(goal)} x {len(goal)}, the start {len(start)} x {len(start)}')
+        if not _solvable(start, goal):
+            raise ValueError('The goal cannot be reached from the start')
+    except (ValueError, KeyError, TypeError) as e:
+        return json.dumps({'id': task.get('id') if isinstance(task, dict) else None, 'error': f'{type(e).__name__}: {e}'})
+
+    begin = time.perf_counter()
+    solution = _main(start, goal, _OPTIONS['heuristic'], _OPTIONS['engine'], table_size=_OPTIONS['table_size'],
+                     pdb_directory=_OPTIONS['pdb_directory'], verbose=False)
+    shorter = None if solution is None else _shorten(solution, _OPTIONS['window'])
+    moves = None if shorter is None else [list(move) for move in _extract_move_list(shorter)]
+    return json.dumps({
+        'id': task.get('id'),
+        'moves': moves,
+        'length': None if moves is None else len(moves),
+        'length_before': None if solution is None else len(solution) - 1,
+        'seconds': round(time.perf_counter() - begin, 6),
+    })
+
+
+def _batch(source: TextIO, target: TextIO, workers: int | None = None, heuristic: str = 'manhattan',
+           engine: str = 'astar', window: int = 0, table_size: int = 1 << 20, pdb_directory: str | None = None) -> None:
+    '''
+    Solves the boards of a JSON lines file in a process pool and writes one JSON line per board, in input order, as
+    soon as it is solved. Every worker builds the stages of a goal once and reuses them for all its boards, pattern
+    databases are memory-mapped and thus shared through the page cache.
+
+    Boards are submitted while they are read, at most 4 per worker ahead of the oldest unwritten one, so the input
+    may be a stream. A thread writes the results, so this does not wait for the next line to be read.
+    '''
+
+    workers = workers or os.cpu_count() or 1
+    pending: Queue[Future[str] | None] = Queue(4 * workers)
+    errors: list[BaseException] = []
+
+    def write() -> None:
+        while (future := pending.get()) is not None:
+            try:
+                target.write(future.result() + '\n')
+                target.flush()
+            except Exception as e:  # pylint: disable=W0718
+                errors.append(e)  # keep draining, so the reader never blocks on a full queue
+
+    with ProcessPoolExecutor(workers, initializer=_init_batch,
+                             initargs=(heuristic, engine, window, table_size, pdb_directory)) as pool:
+        writer = Thread(target=write)
+        writer.start()
+        try:
+            for line in source:
+                if errors:
+                    break
+                if line.strip():
+                    pending.put(pool.submit(_solve_board, line))
+        finally:
+            pending.put(None)
+            writer.join()
+    if errors:
+        raise errors[0]
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Solves the 15-puzzle in stages.')
+    parser.add_argument('--batch', metavar='FILE',
+                        help="solve the boards in a JSON lines file ('-' for stdin) and write JSON lines to stdout")
+    parser.add_argument('--workers', type=int, help='processes for --batch, defaults to the number of CPUs')
+    parser.add_argument('--heuristic', choices=list(_HEURISTICS), default='manhattan')
+    parser.add_argument('--engine', choices=list(_ENGINES), default='astar')
+    parser.add_argument('--window', type=int, default=0, help='moves searched ahead for shortcuts in the solution')
+    parser.add_argument('--table-size', type=int, default=1 << 20, help='entries of the transposition table of idastar')
+    parser.add_argument('--pdb-directory', help='where the pattern databases of --heuristic pdb are cached, defaults to '
+                        f'$TAOISTIC_SEARCH_PDB_DIRECTORY or {_PDB_DIRECTORY}')
+    args = parser.parse_args()
+
+    if args.batch:
+        with (sys.stdin if args.batch == '-' else open(args.batch, encoding='utf-8')) as boards:
+            _batch(boards, sys.stdout, args.workers, args.heuristic, args.engine, args.window, args.table_size, args.pdb_directory)
+        sys.exit()
+
     start_state: State = (
         ('0', '14',  '8', '12'),
         ('10', '11', '13',  '9'),
@@ -248,8 +858,8 @@ if __name__ == '__main__':
         ('12', '13', '14', '15')
     )
 
-    Path = _main(start_state, goal_state)
+    Path = _main(start_state, goal_state, args.heuristic, args.engine, table_size=args.table_size, pdb_directory=args.pdb_directory)
     if Path:
-        print(len(Path)-1)
-        print(len(_shorten(Path)) - 1)
-        print(_shorten(Path))
+        Shorter = _shorten(Path, args.window)
+        print(f'{len(Path) - 1} moves, {len(Shorter) - 1} after shortening')
+        print(Shorter)
@@ -38,8 +38,6 @@ from tabulate import tabulate
 
 from backtrack_solver import CSP, Assignment, all_different, solve
 
-from zebra2 import solve as solve2
-
 
 @dataclass
 class _Zebra:
@@ -104,7 +102,7 @@ def main():
         | all_different(colors)
 
     csp: CSP = (variables, values, constraints)
-    solution: Assignment = solve2(csp)
+    solution: Assignment = solve(csp)
 
     for x in solution:
         print(f'{x}: {solution[x]}')